@@ -29,6 +29,8 @@ class Deduccion(object):
     Clase con la lógica de deducciones, controla que la deducción a ser
     aplicada no exceda el máximo.
     """
+    __slots__ = ('tipo', '_cantidad', '_max', '_variables', '_maximo_code',
+                 '_autonomo', '_rel_de_dep', 'ganancias')
 
     def __init__(self, tipo, cantidad=None, maximo=None, autonomo=True, 
                  relacion_de_dependencia=True):
@@ -37,8 +39,16 @@ class Deduccion(object):
                              "deducciones que no son anuales")
 
         self.tipo = tipo
-        self._cantidad = cantidad and Decimal(str(cantidad))
+        if cantidad and not isinstance(cantidad, Decimal):
+            cantidad = Decimal(str(cantidad))
+
+        self._cantidad = cantidad
         self._max = maximo
+        self._variables = []
+        self._maximo_code = None
+        if maximo:
+            self._compilar_maximo(maximo)
+
         self._autonomo = autonomo
         self._rel_de_dep = relacion_de_dependencia
         self.ganancias = None
@@ -47,33 +57,95 @@ class Deduccion(object):
         # Devuelve la cantidad definida para la deduccion solo si no excede
         # el maximo anual que establece la ley, en ese caso devuelve ese
         # maximo.
-        return min(self._cantidad, self.maximo)
+        return self.calcular_cantidad()
+
+    def calcular_cantidad(self, valores=None):
+        """
+        Devuelve la cantidad de la deducción. 'valores' permite pasar ya
+        resueltas las variables del máximo (por ejemplo la ganancia neta
+        anual) para no volver a calcularlas en cada mes.
+        """
+        return min(self._cantidad, self._calcular_maximo(valores))
     
     def _set_cantidad(self, val):
         # Simplemente guardamos el valor deseado para la deducción
         self._cantidad = val
 
-    def _calcular_maximo(self):
-        if not self._max:
+    def _compilar_maximo(self, maximo):
+        # La fórmula del máximo se valida y compila una sola vez, las
+        # variables entre llaves se resuelven recién al evaluarla. Solo se
+        # aceptan identificadores entre llaves, cualquier otra llave que
+        # quede hace fallar la validación.
+        self._variables = re.findall(r'{(\w+)}', maximo)
+        sin_variables = re.sub(r'{\w+}', '0', maximo)
+        if not re.match('^[\d \*\+\.\-/]+$', sin_variables):
+            raise ValueError("Por seguridad la operacion no puede tener "\
+                             "otro caracter que no sea numero o un operador")
+
+        expresion = re.sub(r'{(\w+)}', r'\1', maximo)
+        self._maximo_code = compile(expresion, '<maximo>', 'eval')
+
+    def _calcular_maximo(self, valores=None):
+        if self._maximo_code is None:
             return sys.maxint
 
-        maximo = self._max
-        for val in re.findall('{(.*?)}', self._max):
-            atributo_ganancias = str(getattr(self.ganancias, val)) 
-            maximo = maximo.replace('{%s}' % val, atributo_ganancias)
+        variables = {}
+        for val in self._variables:
+            # Las variables pueden venir ya resueltas, ser de la deducción
+            # misma (_cantidad) o del objeto ganancias al que pertenece.
+            if valores and val in valores:
+                valor = valores[val]
+            else:
+                origen = self if hasattr(self, val) else self.ganancias
+                valor = getattr(origen, val)
 
-        if not re.match('^[\d \*\+\.\-/]+$', maximo):
-            raise ValueError("Por seguridad la operacion no puede tener "\
-                             "otro caracter que no sea numero o un operador")
-        
-        return Decimal(str(eval(maximo)))
+            variables[val] = float(valor)
+
+        return Decimal(str(eval(self._maximo_code, {}, variables)))
+
+    def _es_fija(self):
+        # La cantidad no depende de ningún valor del objeto ganancias
+        return all(hasattr(self, val) for val in self._variables)
+
+    def clonar(self):
+        """
+        Devuelve una nueva instancia de Deduccion con todos los miembros
+        de la actual.
+        """
+        nueva = Deduccion.__new__(Deduccion)
+        nueva.tipo = self.tipo
+        nueva._cantidad = self._cantidad
+        nueva._max = self._max
+        nueva._variables = self._variables
+        nueva._maximo_code = self._maximo_code
+        nueva._autonomo = self._autonomo
+        nueva._rel_de_dep = self._rel_de_dep
+        nueva.ganancias = self.ganancias
+        return nueva
+
+    def __getstate__(self):
+        # Con __slots__ pickle necesita el estado explícito. La fórmula
+        # compilada no se puede serializar, se vuelve a compilar al cargar.
+        return dict((atributo, getattr(self, atributo))
+                    for atributo in self.__slots__
+                    if atributo not in ('_variables', '_maximo_code'))
+
+    def __setstate__(self, estado):
+        for atributo, valor in estado.items():
+            setattr(self, atributo, valor)
+
+        self._variables = []
+        self._maximo_code = None
+        if self._max:
+            self._compilar_maximo(self._max)
 
     cantidad = property(_get_cantidad, _set_cantidad)
     maximo = property(_calcular_maximo)
+    fija = property(_es_fija)
 
 
 # Deducciones anuales (Art. 23)
-POSIBLES_DEDUCCIONES = [
+POSIBLES_DEDUCCIONES = (
     Deduccion(u'Cónyuge', Decimal('10000.0')),
     Deduccion(u'Hijos', Decimal('5000.0')),
     Deduccion(u'Padres y otros', Decimal('3750.0')),
@@ -93,4 +165,4 @@ POSIBLES_DEDUCCIONES = [
     Deduccion(u'Deducción especial (inc c)', Decimal('9000.0'), 
               relacion_de_dependencia=False),
     Deduccion(u'Ganancia no imponible', Decimal('9000.0')),
-]
+)
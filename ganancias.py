@@ -47,6 +47,17 @@ ALICUOTAS = [
     (Decimal('0.35'), Decimal('120000.0'), Decimal('28500.0')),
 ]
 
+# Las mismas alicuotas con el excedente y el fijo llevados a un mes
+_ALICUOTAS_MENSUALES = [(porc, excede / 12, fijo / 12)
+                        for porc, excede, fijo in ALICUOTAS]
+
+# Excedentes y fijos acumulados de cada alicuota para cada mes del año
+_RANGOS_POR_MES = [[a[1] * mes for a in _ALICUOTAS_MENSUALES]
+                   for mes in range(1, 13)]
+_FIJOS_POR_MES = [[a[2] * mes for a in _ALICUOTAS_MENSUALES]
+                  for mes in range(1, 13)]
+_PORCENTAJES = [a[0] for a in ALICUOTAS]
+
 # Aportes mensuales
 APORTES = [
     (u'Jubilación', Decimal('0.11')),
@@ -54,6 +65,82 @@ APORTES = [
     (u'Obra Social', Decimal('0.03')),
 ]
 
+# Porcentaje total de aportes sobre el bruto
+_APORTES_TOTAL = sum(a[1] for a in APORTES)
+
+
+def _calcular_impuestos(netos, deducciones_mes):
+    """
+    Calcula el impuesto de cada mes a partir de los netos y del total de
+    deducciones anuales de cada mes. Devuelve una lista con los 12 impuestos.
+    """
+    impuestos = []
+    neto_acumulado = impuesto_acumulado = 0
+    tablas = zip(netos, deducciones_mes, _RANGOS_POR_MES, _FIJOS_POR_MES)
+    for mes, (neto, deducciones, rango_sueldos, fijos) in enumerate(tablas, 1):
+        # Deducciones proporcionales a los meses transcurridos
+        deducciones = (deducciones / 12) * mes
+
+        neto_acumulado += neto
+        gravado = max(neto_acumulado - deducciones, 0)
+
+        # Acá vemos en que lugar de la tabla de alicuotas cae el neto 
+        # acumulado menos las deducciones. El numero que devuelve 
+        # corresponde al índice de la lista.
+        idx = max(bisect_left(rango_sueldos, gravado) - 1, 0)
+
+        # Calculamos el impuesto
+        excedente = (gravado - rango_sueldos[idx]) * _PORCENTAJES[idx]
+        impuesto = (fijos[idx] + excedente) - impuesto_acumulado
+
+        impuestos.append(max(impuesto, 0))
+        impuesto_acumulado += impuesto
+
+    return impuestos
+
+
+def _sumar_aguinaldo(brutos):
+    # Devuelve los brutos del año con el aguinaldo sumado en junio y
+    # diciembre. El aguinaldo corresponde a la mitad del mayor sueldo y los
+    # ciclos son semestrales, si no se cobró sueldo en todo el semestre el
+    # aguinaldo es proporcional a los meses trabajados.
+    brutos = list(brutos)
+    aguinaldo = max(brutos) / 2
+    for ciclo in (6, 12):
+        meses = len([bruto for bruto in brutos[ciclo - 6:ciclo] if bruto])
+        brutos[ciclo - 1] += aguinaldo * meses / 6
+
+    return brutos
+
+
+def _obtener_deduccion(deduccion):
+    # Valida el tipo de deducción y devuelve la deducción posible. Los
+    # índices negativos también son válidos para la tupla, así que se
+    # descartan antes.
+    try:
+        if deduccion >= 0:
+            return POSIBLES_DEDUCCIONES[deduccion]
+    except (IndexError, TypeError):
+        pass
+
+    raise ValueError(u"Tipo de deducción inválida")
+
+
+def _nueva_deduccion(deduccion, cantidad=None, ganancias=None):
+    # Las deducciones posibles son compartidas, se devuelve una copia
+    # para no modificar la cantidad de todos los sueldos.
+    deduccion = _obtener_deduccion(deduccion).clonar()
+    deduccion.ganancias = ganancias
+
+    if not ganancias and not deduccion.cantidad:
+        raise ValueError("Esta deducción es anual y debe agregarse "\
+                         "al objeto ganancias.")
+
+    if cantidad:
+        deduccion.cantidad = cantidad
+
+    return deduccion
+
 
 class Ganancias(object):
     """
@@ -74,26 +161,16 @@ class Ganancias(object):
         self._deducciones = []
         self._con_aguinaldo = aguinaldo
         # Para calcular ganancias, necesitamos los sueldos de todo el año
-        self.meses = [Sueldo(sueldo_bruto) for i in xrange(12)]
+        self.meses = [Sueldo(sueldo_bruto) for i in range(12)]
 
         self._calcular_aguinaldo()
 
     def _calcular_aguinaldo(self):
         # Calcular aguinaldo si corresponde.
         if self._con_aguinaldo:
-            # El aguinaldo corresponde a la mitad del mayor sueldo
-            sueldo_maximo = max(self.meses)
-
-            # Primero agregamos el aguinaldo asumiendo que lo tiene
-            self.meses[5] += sueldo_maximo / 2
-            self.meses[11] += sueldo_maximo / 2
-
-            # Los ciclos son semestrales
-            for ciclo in (6, 12):
-                idx = ciclo - 6
-                meses = len([suel for suel in self.meses[idx:ciclo] if suel])
-                if meses != 6:
-                    self.meses[ciclo - 1] *= meses / 6
+            brutos = _sumar_aguinaldo(sueldo.bruto for sueldo in self.meses)
+            for sueldo, bruto in zip(self.meses, brutos):
+                sueldo.bruto = bruto
 
     def cambiar_mes(self, mes, sueldo, bonos=0):
         """
@@ -107,36 +184,35 @@ class Ganancias(object):
 
     def _impuesto_anual(self):
         # Calcula el impuesto anual como la sumatoria de todos los meses
-        impuesto = 0
-        for sueldo in self.meses:
-            impuesto += sueldo.impuesto_ganancias
-
-        return impuesto
+        return sum(sueldo.impuesto_ganancias for sueldo in self.meses)
 
     def _bruto_anual(self):
         # Suma todos los sueldos brutos del año.
-        return sum(self.meses).bruto
+        return sum(sueldo.bruto for sueldo in self.meses)
 
     def _ganancia_neta_anual(self):
-        return sum(self.meses).ganancia_neta
+        bruto = self._bruto_anual()
+        return bruto - bruto * _APORTES_TOTAL
 
     def eliminar_deduccion(self, deduccion, mes=None):
         """
         Eliminar una deducción en el mes dado. Si no se especifica ningún
         mes, la acción es repetida en todo el año.
         """
-        meses = [mes] if mes else xrange(12)
+        tipo = _obtener_deduccion(deduccion).tipo
+        meses = [mes] if mes else range(12)
         for mes in meses:
-            self.meses[mes].eliminar_deduccion(deduccion)
+            self.meses[mes]._quitar_deduccion(tipo)
 
     def agregar_deduccion(self, deduccion, cantidad=None, mes=None):
         """
         Agrega una deducción en el mes dado. Si no se especifica ningún
         mes, la acción es repetida en todo el año.
         """
-        meses = [mes] if mes else xrange(12)
+        deduccion = _nueva_deduccion(deduccion, cantidad, self)
+        meses = [mes] if mes else range(12)
         for mes in meses:
-            self.meses[mes].agregar_deduccion(deduccion, cantidad, self)
+            self.meses[mes].deducciones.append(deduccion)
 
     def calcular_ganancias(self):
         """
@@ -152,36 +228,80 @@ class Ganancias(object):
         else:
             self.agregar_deduccion(DEDUCCION_ESPECIAL_REL)
 
-        neto_acumulado = impuesto_acumulado = 0
-        for mes, sueldo in enumerate(self.meses):
-            mes += 1
-            rango_sueldos = [(r[1] / 12) * mes for r in ALICUOTAS]
-
-            # Sumamos las deducciones a ser aplicadas este mes
-            deducciones = sum((d.cantidad for d in sueldo.deducciones))
-            deducciones = (deducciones / 12) * mes
-
-            # Calculamos todos los aportes del mes
-            aportes = sum((monto for aporte, monto in sueldo.aportes))
-
-            neto_acumulado += sueldo.bruto - aportes
-            gravado = max(neto_acumulado - deducciones, 0)
-
-            # Acá vemos en que lugar de la tabla de alicuotas cae el neto 
-            # acumulado menos las deducciones. El numero que devuelve 
-            # corresponde al índice de la lista.
-            idx = max(bisect_left(rango_sueldos, gravado) - 1, 0)
-
-            porc, excede, fijo = ALICUOTAS[idx]
-            fijo = (fijo / 12) * mes
-            excede = (excede / 12) * mes
-
-            # Calculamos el impuesto
-            impuesto = (fijo + (gravado - excede) * porc) - impuesto_acumulado
-
-            # Lo guardamos en el sueldo del mes
-            sueldo.impuesto_ganancias = max(impuesto, 0)
-            impuesto_acumulado += impuesto
+        # Primero juntamos los netos y las deducciones de cada mes, así el
+        # cálculo del impuesto recorre solamente valores ya resueltos. Los
+        # meses no cambian durante el cálculo, así que la ganancia neta
+        # anual de los máximos se calcula una sola vez.
+        valores = {'ganancia_neta_anual': self.ganancia_neta_anual}
+        netos = [sueldo.ganancia_neta for sueldo in self.meses]
+        deducciones_mes = [sum((d.calcular_cantidad(valores)
+                                for d in sueldo.deducciones))
+                           for sueldo in self.meses]
+
+        impuestos = _calcular_impuestos(netos, deducciones_mes)
+        for sueldo, impuesto in zip(self.meses, impuestos):
+            sueldo.impuesto_ganancias = impuesto
+
+    @classmethod
+    def calcular_lote(cls, sueldos, autonomo=False, aguinaldo=True,
+                      deducciones=()):
+        """
+        Calcula el impuesto anual de varios sueldos brutos con las mismas
+        condiciones, sin armar un objeto Ganancias por sueldo. Las
+        deducciones se aplican a todo el año, cada una es un tipo de
+        deducción o un par (deducción, cantidad). Devuelve una lista con el
+        impuesto anual de cada sueldo.
+
+        Ejemplo:
+            >>> impuestos = Ganancias.calcular_lote([8000, 12000],
+            ...                                     deducciones=[HIJOS])
+            >>> print ["%.2f" % impuesto for impuesto in impuestos]
+            ['4032.80', '14415.60']
+        """
+        # Las mismas deducciones que agrega calcular_ganancias
+        tipos = list(deducciones) + [GANANCIA_NO_IMPONIBLE]
+        if autonomo:
+            tipos.append(DEDUCCION_ESPECIAL_AUTON)
+        else:
+            tipos.append(DEDUCCION_ESPECIAL_REL)
+
+        # Las deducciones que no dependen del sueldo se resuelven una sola
+        # vez para todo el lote, el resto se calcula por sueldo.
+        fijas = 0
+        variables = []
+        for deduccion in tipos:
+            cantidad = None
+            if isinstance(deduccion, tuple):
+                deduccion, cantidad = deduccion
+
+            deduccion = _obtener_deduccion(deduccion).clonar()
+            if cantidad:
+                deduccion.cantidad = cantidad
+
+            if deduccion.fija:
+                fijas += deduccion.cantidad
+            else:
+                variables.append(deduccion)
+
+        impuestos = []
+        for sueldo_bruto in sueldos:
+            if not isinstance(sueldo_bruto, Decimal):
+                sueldo_bruto = Decimal(str(sueldo_bruto))
+
+            brutos = [sueldo_bruto] * 12
+            if aguinaldo:
+                brutos = _sumar_aguinaldo(brutos)
+
+            netos = [bruto - bruto * _APORTES_TOTAL for bruto in brutos]
+            bruto_anual = sum(brutos)
+            valores = {
+                'ganancia_neta_anual': bruto_anual - bruto_anual * _APORTES_TOTAL
+            }
+            total = fijas + sum(d.calcular_cantidad(valores) for d in variables)
+
+            impuestos.append(sum(_calcular_impuestos(netos, [total] * 12)))
+
+        return impuestos
 
     bruto_anual = property(_bruto_anual)
     ganancia_neta_anual = property(_ganancia_neta_anual)
@@ -193,72 +313,69 @@ class Sueldo(object):
     Clase que representa un sueldo, contiene las deducciones, aportes 
     y el impuesto a las ganancias una vez que esté calculado.
     """
+    __slots__ = ('bruto', 'deducciones', '_impuesto_ganancias')
 
     def __init__(self, sueldo_bruto):
-        self.bruto = Decimal(str(sueldo_bruto))
+        if not isinstance(sueldo_bruto, Decimal):
+            sueldo_bruto = Decimal(str(sueldo_bruto))
+
+        self.bruto = sueldo_bruto
         self.deducciones = []
-        self._impuesto_ganancias = -1
+        self._impuesto_ganancias = None
 
     def _set_impuesto_ganancias(self, value):
         # Guardamos el cálculo del impuesto
         self._impuesto_ganancias = value
 
-    def _impuesto_ganancias(self):
+    def _get_impuesto_ganancias(self):
         # Se usan properties acá para poder advertir cuando el impuesto
         # no ha sido calculado.
-        if self._impuesto_ganancias == -1:
+        if self._impuesto_ganancias is None:
             raise ValueError("El impuesto a las ganancias no está calculado")
 
         return self._impuesto_ganancias
 
     def _ganancia_neta(self):
         # La ganancia neta corresponde al bruto sin los aportes
-        contrib_suma = sum((a[1] for a in self.aportes))
-        return self.bruto - contrib_suma
+        return self.bruto - self.bruto * _APORTES_TOTAL
 
     def _sueldo_neto(self):
         # El sueldo neto corresponde al bruto sin los aportes e impuestos
-        contrib_suma = sum((a[1] for a in self.aportes))
-        return self.bruto - contrib_suma - self.impuesto_ganancias
+        return self.ganancia_neta - self.impuesto_ganancias
 
     def eliminar_deduccion(self, deduccion):
         """
         Eliminar una deducción. Las deducciones se encuentran en el módulo
         'deduccion'.
         """
+        self._quitar_deduccion(_obtener_deduccion(deduccion).tipo)
 
-        if deduccion < 0 or deduccion > len(POSIBLES_DEDUCCIONES):
-            raise ValueError(u"Tipo de deducción inválida")
+    def _quitar_deduccion(self, tipo):
+        # Cada sueldo tiene su propia copia de la deducción, así que se
+        # busca por tipo.
+        for agregada in self.deducciones:
+            if agregada.tipo == tipo:
+                self.deducciones.remove(agregada)
+                return
 
-        self.deducciones.remove(POSIBLES_DEDUCCIONES[deduccion])
+        raise ValueError(u"La deducción no está en el sueldo")
 
     def agregar_deduccion(self, deduccion, cantidad=None, ganancias=None):
         """
         Agregar una deducción al sueldo. Las deducciones se encuentran en el 
         módulo 'deduccion'.
         """
-        if deduccion < 0 or deduccion > len(POSIBLES_DEDUCCIONES):
-            raise ValueError("Tipo de deducción inválida")
-
-        deduccion = POSIBLES_DEDUCCIONES[deduccion]
-        deduccion.ganancias = ganancias
-        
-        if not ganancias and not deduccion.cantidad:
-            raise ValueError("Esta deducción es anual y debe agregarse "\
-                             "al objeto ganancias.")
-
-        if cantidad:
-            deduccion.cantidad = cantidad
-
-        self.deducciones.append(deduccion)
+        nueva = _nueva_deduccion(deduccion, cantidad, ganancias)
+        self.deducciones.append(nueva)
 
     def clonar(self):
         """
         Devuelve una nueva instancia de Sueldo con todas los miembros
         del actual.
         """
-        nuevo_sueldo = Sueldo(self.bruto)
-        nuevo_sueldo.deducciones = self.deducciones
+        nuevo_sueldo = Sueldo.__new__(Sueldo)
+        nuevo_sueldo.bruto = self.bruto
+        nuevo_sueldo.deducciones = list(self.deducciones)
         nuevo_sueldo._impuesto_ganancias = self._impuesto_ganancias
         return nuevo_sueldo
 
@@ -267,6 +384,15 @@ class Sueldo(object):
         # tabla de aportes
         return [(a[0], self.bruto * a[1]) for a in APORTES]
 
+    def __getstate__(self):
+        # Con __slots__ pickle necesita el estado explícito
+        return dict((atributo, getattr(self, atributo))
+                    for atributo in self.__slots__)
+
+    def __setstate__(self, estado):
+        for atributo, valor in estado.items():
+            setattr(self, atributo, valor)
+
     # ---- Operaciones -----
     def __div__(self, num):
         if isinstance(num, Sueldo):
@@ -300,5 +426,6 @@ class Sueldo(object):
     aportes = property(_aportes)
     neto = property(_sueldo_neto)
     ganancia_neta = property(_ganancia_neta)
-    impuesto_ganancias = property(_impuesto_ganancias, _set_impuesto_ganancias)
+    impuesto_ganancias = property(_get_impuesto_ganancias,
+                                  _set_impuesto_ganancias)
 